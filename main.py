@@ -1,14 +1,129 @@
+import asyncio
+import hashlib
+import re
+import urllib.parse
+from contextlib import asynccontextmanager
+
 import httpx
-from fastapi import FastAPI, HTTPException, Response
+from cachetools import LRUCache, TTLCache
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from bs4 import BeautifulSoup
+from starlette.concurrency import run_in_threadpool
+import lxml.etree
+import lxml.html
 import uvicorn
 
+# --- Outline Cache ---
+# Wikipedia country pages change infrequently, so the finished outline is
+# cached per country for an hour. Entries are (etag, prebuilt Response)
+# tuples served verbatim on a hit; the lock keeps concurrent handlers
+# from corrupting the cache internals.
+#
+# A second, non-expiring cache keeps the last known body together with the
+# upstream ETag/Last-Modified validators. When a TTL entry lapses we send a
+# conditional GET; Wikipedia's 304 answer is a few hundred bytes and lets us
+# reuse the previously built outline instead of re-downloading and re-parsing.
+# Entries are (body_bytes, etag, upstream_etag, upstream_last_modified).
+CACHE_TTL = 3600
+_CACHE_CONTROL = f"public, max-age={CACHE_TTL}"
+_MEDIA_TYPE = "text/plain; charset=utf-8"
+_outline_cache: TTLCache = TTLCache(maxsize=512, ttl=CACHE_TTL)
+_stale_cache: LRUCache = LRUCache(maxsize=512)
+_cache_lock = asyncio.Lock()
+
+# Singleflight map: the first cache miss for a country registers a Future
+# here and does the fetch/parse; concurrent misses for the same country
+# await that Future instead of issuing duplicate upstream requests.
+_inflight: dict[str, "asyncio.Future[tuple[str, Response]]"] = {}
+
+
+def _make_response(body: bytes, etag: str) -> Response:
+    """
+    Builds the full 200 response for an outline once. The object is
+    cached and returned verbatim for every hit - it is never mutated
+    after construction, so sharing it across requests is safe and skips
+    Starlette's per-request header assembly.
+    """
+    return Response(
+        content=body,
+        media_type=_MEDIA_TYPE,
+        headers={
+            "Cache-Control": _CACHE_CONTROL,
+            "ETag": etag,
+            "Content-Length": str(len(body)),
+        },
+    )
+
+# Upper bound on a single article download. Parsoid HTML for even the
+# largest country pages is well under this; anything bigger is aborted
+# mid-stream instead of being buffered to completion.
+MAX_ARTICLE_BYTES = 8 * 1024 * 1024
+
+# Strips the "[edit]"/"[Edit]" section-edit links in one pass instead of
+# two .replace() walks per heading.
+_EDIT_RE = re.compile(r"\[[Ee]dit\]")
+
+# Country names: letters plus the punctuation that occurs in real country
+# titles (spaces, periods, apostrophes, hyphens, parentheses), capped at
+# 81 chars. Anything else is rejected with a 400 before we spend a
+# Wikipedia round-trip discovering it 404s.
+_VALID_COUNTRY = re.compile(r"^[A-Za-z][A-Za-z .'\-()]{0,80}$")
+
+# Wikipedia always serves UTF-8, so pin the encoding instead of letting
+# lxml sniff it, and skip tree features the heading query never touches:
+# comments, processing instructions, and the id->element lookup table.
+_HTML_PARSER = lxml.html.HTMLParser(
+    encoding="utf-8", remove_comments=True, remove_pis=True, collect_ids=False
+)
+
+# Compiled once at import, like re.compile for regexes: each request just
+# invokes the prepared evaluator instead of re-parsing the XPath string.
+_TITLE_XPATH = lxml.etree.XPath("string(/html/head/title)")
+_HEADINGS_XPATH = lxml.etree.XPath(
+    "//*[self::h2 or self::h3 or self::h4 or self::h5 or self::h6]"
+)
+
+# Markdown prefixes for heading levels 1-6, precomputed once so the hot
+# loop avoids rebuilding '#' * level for every heading. Kept as bytes:
+# the outline is assembled as a list of byte strings and joined once,
+# so Starlette never has to re-encode the response body.
+_PREFIX = tuple(("#" * i + " ").encode() if i else b"" for i in range(7))
+
+
+# --- Application Lifespan ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates one shared httpx.AsyncClient for the whole process so every
+    request reuses pooled keep-alive connections (and HTTP/2 multiplexing)
+    to Wikipedia instead of paying a fresh TCP+TLS handshake per call.
+    """
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        # Tight per-operation timeouts: a slow upstream response should
+        # fail fast instead of pinning an async worker slot for 30s.
+        timeout=httpx.Timeout(connect=2.0, read=5.0, write=5.0, pool=2.0),
+        # Titles like "Burma" redirect to their canonical article; follow
+        # them instead of surfacing a needless 404.
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        headers={
+            # Wikipedia's UA policy wants a descriptive agent with contact
+            # info; a proper UA also avoids throttling on their side.
+            "User-Agent": "GlobalEduBot/1.0 (contact@globaledu.example)",
+            "Accept-Encoding": "gzip, br",
+        },
+    )
+    yield
+    await app.state.http.aclose()
+
+
 # Initialize the FastAPI application
 app = FastAPI(
     title="Wikipedia Country Outline API",
     description="An API to fetch the hierarchical outline of a country's Wikipedia page as Markdown.",
-    version="1.0.2", # Version updated for final logic
+    version="1.1.0",
+    lifespan=lifespan,
 )
 
 # --- CORS Configuration ---
@@ -20,6 +135,129 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def _build_markdown(content: bytes) -> bytes:
+    """
+    Extracts the headings from Parsoid article HTML and assembles the
+    Markdown outline. Pure CPU-bound work: the caller runs this on the
+    threadpool to keep the event loop free.
+    """
+    # Feed raw bytes with the UTF-8 parser so no full-document decode or
+    # charset sniff ever runs. XPath stays in lxml's C layer and only
+    # materializes the heading nodes we actually want, instead of
+    # wrapping the whole tree.
+    root = lxml.html.fromstring(content, parser=_HTML_PARSER)
+
+    markdown_outline: list[bytes] = []
+
+    # --- CORRECTED LOGIC ---
+    # 1. Manually add 'Contents' as the first heading at level 2.
+    # This directly addresses the error "Expected level 2 but got 1".
+    markdown_outline.append(b"## Contents")
+
+    # 2. Add the main page title as the second heading. Parsoid HTML
+    # has no h1#firstHeading; the page title lives in <head><title>
+    # in dbkey form, so underscores map back to spaces.
+    title = _TITLE_XPATH(root).strip().replace("_", " ")
+    if title:
+        markdown_outline.append(b"# " + title.encode("utf-8"))
+
+    # 3. Process all section headings (H2-H6). Parsoid wraps sections
+    # in <section> tags rather than a mw-content-text div.
+    headings = _HEADINGS_XPATH(root)
+
+    for heading in headings:
+        text = _EDIT_RE.sub('', heading.text_content().strip())
+
+        # We must skip the actual "Contents" heading from the page,
+        # since we manually added it at the beginning.
+        if "Contents" in text:
+            continue
+
+        level = ord(heading.tag[1]) - 48
+        markdown_outline.append(_PREFIX[level] + text.encode("utf-8"))
+
+    return b"\n".join(markdown_outline)
+
+
+async def _build_outline(
+    client: httpx.AsyncClient, page_title: str, stale: tuple | None = None
+) -> tuple[bytes | None, str | None, str | None]:
+    """
+    Fetches the Wikipedia page with the given (already normalized) title
+    and builds the Markdown outline. Returns (body, upstream_etag,
+    upstream_last_modified) with the body as UTF-8 bytes ready to cache
+    and serve.
+
+    If a stale cache entry is supplied, its upstream validators are sent
+    as a conditional GET; on a 304 the body comes back as None and the
+    caller should reuse the stale outline.
+    """
+    # The REST page/html endpoint serves raw Parsoid article HTML without
+    # the desktop chrome (sidebars, nav, scripts) of /wiki/ pages, so the
+    # transfer is markedly smaller and the markup structure is stable.
+    wikipedia_url = (
+        "https://en.wikipedia.org/api/rest_v1/page/html/"
+        + urllib.parse.quote(page_title, safe="_")
+    )
+
+    conditional_headers = {}
+    if stale is not None:
+        _, _, upstream_etag, upstream_last_modified = stale
+        if upstream_etag:
+            conditional_headers["If-None-Match"] = upstream_etag
+        if upstream_last_modified:
+            conditional_headers["If-Modified-Since"] = upstream_last_modified
+
+    try:
+        # Stream the body in chunks so an oversized (or misbehaving)
+        # response is cut off at MAX_ARTICLE_BYTES rather than buffered
+        # to completion before we notice. One quick retry with a short
+        # backoff absorbs transient connect/read hiccups.
+        for attempt in range(2):
+            try:
+                async with client.stream(
+                    "GET", wikipedia_url, headers=conditional_headers
+                ) as response:
+                    if response.status_code == 304:
+                        return None, None, None
+                    response.raise_for_status()
+
+                    content = bytearray()
+                    async for chunk in response.aiter_bytes(65536):
+                        content += chunk
+                        if len(content) > MAX_ARTICLE_BYTES:
+                            raise HTTPException(
+                                status_code=502,
+                                detail=f"Wikipedia response for '{page_title}' exceeded the size limit.",
+                            )
+                break
+            except (httpx.ConnectError, httpx.ReadTimeout):
+                if attempt:
+                    raise
+                await asyncio.sleep(0.1)
+
+        upstream_etag = response.headers.get("etag")
+        upstream_last_modified = response.headers.get("last-modified")
+
+        # The lxml parse and Markdown assembly are synchronous CPU work;
+        # run them on the threadpool so a big article does not stall the
+        # event loop and serialize every other in-flight request.
+        body = await run_in_threadpool(_build_markdown, bytes(content))
+
+        return body, upstream_etag, upstream_last_modified
+
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Wikipedia page for '{page_title}' not found.")
+        else:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch data from Wikipedia: {exc}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
+
 # --- API Endpoint ---
 @app.get(
     "/api/outline",
@@ -30,69 +268,86 @@ app.add_middleware(
             "description": "Successfully retrieved the Markdown outline.",
             "content": {"text/plain": {"example": "## Contents\n# Vanuatu\n## Etymology\n## History\n### Prehistory"}},
         },
+        400: {"description": "Invalid country name."},
         404: {"description": "Country not found on Wikipedia."},
         500: {"description": "Internal server error or failed to fetch data."},
     },
 )
-async def get_country_outline(country: str):
+@app.head("/api/outline", include_in_schema=False)
+async def get_country_outline(country: str, request: Request):
     """
     Fetches the Wikipedia page for a given country, extracts all headings
     (H1 through H6), and returns them as a structured Markdown outline.
 
+    Repeat requests for the same country within the cache TTL are served
+    straight from memory, skipping the Wikipedia round-trip and parse.
+
     - **country**: The name of the country to look up (e.g., "Vanuatu", "India").
     """
-    formatted_country = country.replace(" ", "_")
-    wikipedia_url = f"https://en.wikipedia.org/wiki/{formatted_country}"
+    country = country.strip()
+    if not _VALID_COUNTRY.match(country):
+        raise HTTPException(status_code=400, detail="Invalid country name.")
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(wikipedia_url)
-            response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        markdown_outline = []
-
-        # --- CORRECTED LOGIC ---
-        # 1. Manually add 'Contents' as the first heading at level 2.
-        # This directly addresses the error "Expected level 2 but got 1".
-        markdown_outline.append("## Contents")
-
-        # 2. Add the main page title (H1) as the second heading.
-        title_heading = soup.find('h1', id='firstHeading')
-        if title_heading:
-            markdown_outline.append(f"# {title_heading.get_text(strip=True)}")
-
-        # 3. Process all subsequent headings from the main content.
-        content_div = soup.find(id="mw-content-text")
-        if not content_div:
-            raise HTTPException(status_code=500, detail="Could not find the main content area.")
-        
-        # Find all headings starting from H2
-        headings = content_div.find_all(['h2', 'h3', 'h4', 'h5', 'h6'])
-
-        for heading in headings:
-            text = heading.get_text(strip=True).replace('[edit]', '').replace('[Edit]', '')
-            
-            # We must skip the actual "Contents" heading from the page,
-            # since we manually added it at the beginning.
-            if "Contents" in text:
-                continue
-            
-            level = int(heading.name[1])
-            markdown_outline.append(f"{'#' * level} {text}")
-
-        final_outline = "\n".join(markdown_outline)
-
-        return Response(content=final_outline, media_type="text/plain; charset=utf-8")
+    # MediaWiki only canonicalizes the first letter of a title; anything
+    # beyond that is case-sensitive, so don't .title() multi-word names
+    # like "United States of America". The cache key is fully lowercased
+    # so differently-cased lookups still share an entry.
+    page_title = (country[0].upper() + country[1:]).replace(" ", "_")
+    cache_key = page_title.lower()
 
-    except httpx.HTTPStatusError as exc:
-        if exc.response.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"Wikipedia page for '{country}' not found.")
+    async with _cache_lock:
+        cached = _outline_cache.get(cache_key)
+
+    if cached is None:
+        inflight = _inflight.get(cache_key)
+        if inflight is not None:
+            # Another request is already building this outline; share
+            # its result instead of fetching and parsing again.
+            etag, response = await inflight
         else:
-            raise HTTPException(status_code=500, detail=f"Failed to fetch data from Wikipedia: {exc}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+            future: "asyncio.Future[tuple[str, Response]]" = (
+                asyncio.get_running_loop().create_future()
+            )
+            _inflight[cache_key] = future
+            try:
+                async with _cache_lock:
+                    stale = _stale_cache.get(cache_key)
+
+                body, upstream_etag, upstream_last_modified = await _build_outline(
+                    request.app.state.http, page_title, stale
+                )
+                if body is None:
+                    # Wikipedia said 304: the stale outline is still current,
+                    # so refresh its TTL and keep the existing validators.
+                    body, etag, upstream_etag, upstream_last_modified = stale
+                else:
+                    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+                response = _make_response(body, etag)
+                async with _cache_lock:
+                    _outline_cache[cache_key] = (etag, response)
+                    _stale_cache[cache_key] = (
+                        body, etag, upstream_etag, upstream_last_modified
+                    )
+            except BaseException as exc:
+                future.set_exception(exc)
+                future.exception()  # mark retrieved for the no-waiter case
+                raise
+            else:
+                future.set_result((etag, response))
+            finally:
+                _inflight.pop(cache_key, None)
+    else:
+        etag, response = cached
+
+    # Honor conditional requests so polling clients can skip the body.
+    if request.headers.get("if-none-match") == etag:
+        return Response(
+            status_code=304,
+            headers={"Cache-Control": _CACHE_CONTROL, "ETag": etag},
+        )
 
-# uvicorn main:app --reload
+    return response
 
+# Dev: uvicorn main:app --reload
+# Production launch command: see README.md
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from main import _build_markdown
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def test_vanuatu_fixture_outline():
+    """
+    The captured Parsoid-style page must produce the exact outline:
+    synthetic Contents first, title from <head><title>, heading levels
+    preserved, the in-article Contents heading skipped, and the
+    [edit] span stripped.
+    """
+    html = (FIXTURES / "vanuatu.html").read_bytes()
+
+    expected = b"\n".join([
+        b"## Contents",
+        b"# Vanuatu",
+        b"## Etymology",
+        b"## History",
+        b"### Prehistory",
+        b"### European contact",
+        b"#### Colonial era",
+        b"## Geography",
+    ])
+
+    assert _build_markdown(html) == expected
+
+
+def test_title_underscores_map_to_spaces():
+    html = (
+        b"<html><head><title>Papua_New_Guinea</title></head>"
+        b"<body><section><h2>Geography</h2></section></body></html>"
+    )
+
+    assert _build_markdown(html) == b"## Contents\n# Papua New Guinea\n## Geography"